@@ -0,0 +1,291 @@
+import json
+import math
+
+
+class P2Quantile:
+    # Streaming quantile estimate (Jain & Chlamtac P-square): five markers,
+    # constant memory and constant work per observation.
+    def __init__(self, p=0.95, state=None):
+        self.p = p
+        if state:
+            self.heights = state['heights']
+            self.positions = state['positions']
+            self.desired = state['desired']
+        else:
+            self.heights = []
+            self.positions = [1, 2, 3, 4, 5]
+            self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def state(self):
+        return {
+            'heights': self.heights,
+            'positions': self.positions,
+            'desired': self.desired
+        }
+
+    def value(self):
+        if not self.heights:
+            return None
+        if len(self.heights) < 5:
+            ordered = sorted(self.heights)
+            index = min(len(ordered) - 1, int(round(self.p * (len(ordered) - 1))))
+            return ordered[index]
+        return self.heights[2]
+
+    def add(self, x):
+        q = self.heights
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        # Find the cell the observation falls into, widening the extremes
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Adjust the three middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not q[i - 1] < candidate < q[i + 1]:
+                    candidate = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = candidate
+                n[i] += step
+
+    def _parabolic(self, i, step):
+        q = self.heights
+        n = self.positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+
+class CategoryStats:
+    # Welford running mean/variance plus a quantile sketch for one category
+    def __init__(self, count=0, mean=0.0, m2=0.0, quantile=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.quantile = quantile or P2Quantile()
+
+    def std(self):
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def add(self, amount):
+        self.count += 1
+        delta = amount - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (amount - self.mean)
+        self.quantile.add(amount)
+
+    def remove(self, amount):
+        # Exact inverse of add() for the mean and variance; the quantile
+        # sketch cannot forget a value and keeps it
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        previous = self.mean
+        self.count -= 1
+        self.mean = (previous * (self.count + 1) - amount) / self.count
+        self.m2 = max(0.0, self.m2 - (amount - previous) * (amount - self.mean))
+
+
+class AnomalyDetector:
+    # Flags expenses that are unusually large for their category. Statistics
+    # live in the expenses database and are updated one row at a time, so
+    # scoring an insert never rescans history.
+    def __init__(self, conn, z_threshold=3.0, min_samples=5):
+        self.conn = conn
+        self.z_threshold = z_threshold
+        self.min_samples = min_samples
+        self.setup_tables()
+        self.stats = self.load_stats()
+        if not self.stats:
+            self.seed_from_history()
+
+    def setup_tables(self):
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS category_stats (
+                category TEXT PRIMARY KEY,
+                count INTEGER,
+                mean REAL,
+                m2 REAL,
+                quantile TEXT
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS expense_anomalies (
+                expense_id INTEGER PRIMARY KEY,
+                date TEXT,
+                category TEXT,
+                amount REAL,
+                description TEXT,
+                score REAL,
+                typical REAL
+            )
+        ''')
+        self.conn.commit()
+
+    def load_stats(self):
+        stats = {}
+        for category, count, mean, m2, quantile in self.conn.execute(
+                'SELECT category, count, mean, m2, quantile FROM category_stats'):
+            stats[category] = CategoryStats(count, mean, m2,
+                                            P2Quantile(state=json.loads(quantile)))
+        return stats
+
+    def refresh(self, category):
+        # Another process (the app or the ingest daemon) may have updated
+        # this category since it was loaded. Called after the caller's insert,
+        # so the write lock is held and the row read here is the latest one.
+        row = self.conn.execute('''
+            SELECT count, mean, m2, quantile FROM category_stats WHERE category = ?
+        ''', (category,)).fetchone()
+        if row is None:
+            self.stats.pop(category, None)
+        else:
+            count, mean, m2, quantile = row
+            self.stats[category] = CategoryStats(count, mean, m2,
+                                                 P2Quantile(state=json.loads(quantile)))
+
+    def seed_from_history(self):
+        # One-time pass for ledgers that predate the detector; rows are
+        # streamed from the cursor instead of being fetched all at once
+        cursor = self.conn.execute('''
+            SELECT category, base_amount
+            FROM expenses_converted
+            WHERE base_amount IS NOT NULL
+            ORDER BY id
+        ''')
+        for category, amount in cursor:
+            self.stats.setdefault(category, CategoryStats()).add(amount)
+        for category in self.stats:
+            self.save_stats(category)
+        self.conn.commit()
+
+    def save_stats(self, category):
+        stats = self.stats[category]
+        self.conn.execute('''
+            INSERT OR REPLACE INTO category_stats (category, count, mean, m2, quantile)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (category, stats.count, stats.mean, stats.m2,
+              json.dumps(stats.quantile.state())))
+
+    def score(self, category, amount):
+        # Scored against the statistics before the new row is included
+        stats = self.stats.get(category)
+        if stats is None or stats.count < self.min_samples:
+            return None
+        std = stats.std()
+        if std == 0:
+            return None
+        return (amount - stats.mean) / std
+
+    def is_anomaly(self, category, amount, score):
+        if score is None or score < self.z_threshold:
+            return False
+        upper = self.stats[category].quantile.value()
+        return upper is None or amount > upper
+
+    def observe(self, expense_id, date, category, amount, description):
+        # Score and record one new row. Writes happen on the caller's
+        # connection without committing, so they share the insert's transaction.
+        # Returns the category's mean before this row when it is flagged,
+        # otherwise None.
+        self.refresh(category)
+        score = self.score(category, amount)
+        typical = None
+        if self.is_anomaly(category, amount, score):
+            typical = self.stats[category].mean
+            self.conn.execute('''
+                INSERT OR REPLACE INTO expense_anomalies
+                    (expense_id, date, category, amount, description, score, typical)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (expense_id, date, category, amount, description, score, typical))
+
+        self.stats.setdefault(category, CategoryStats()).add(amount)
+        self.save_stats(category)
+        return typical
+
+    def observe_many(self, rows):
+        # Bulk variant for imports: rows are (id, date, category, amount, description)
+        flagged = []
+        touched = set()
+        for expense_id, date, category, amount, description in rows:
+            if category not in touched:
+                self.refresh(category)
+                touched.add(category)
+            score = self.score(category, amount)
+            if self.is_anomaly(category, amount, score):
+                flagged.append((expense_id, date, category, amount, description,
+                                score, self.stats[category].mean))
+            self.stats.setdefault(category, CategoryStats()).add(amount)
+
+        self.conn.executemany('''
+            INSERT OR REPLACE INTO expense_anomalies
+                (expense_id, date, category, amount, description, score, typical)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', flagged)
+        for category in touched:
+            self.save_stats(category)
+        return flagged
+
+    def forget(self, expense_ids):
+        # Take expenses that are about to be deleted out of the flagged list
+        # and out of their category's mean and variance. Call before the
+        # DELETE, on the same connection, so both share its transaction.
+        removed = []
+        for expense_id in expense_ids:
+            row = self.conn.execute('''
+                SELECT category, base_amount FROM expenses_converted WHERE id = ?
+            ''', (expense_id,)).fetchone()
+            # Rows without a converted amount were never counted
+            if row and row[1] is not None:
+                removed.append(row)
+        self.conn.executemany('DELETE FROM expense_anomalies WHERE expense_id = ?',
+                              [(expense_id,) for expense_id in expense_ids])
+
+        # The DELETE above holds the write lock, so refreshed rows are current
+        touched = set()
+        for category, amount in removed:
+            if category not in touched:
+                self.refresh(category)
+                touched.add(category)
+            if category in self.stats:
+                self.stats[category].remove(amount)
+        for category in touched:
+            if category in self.stats:
+                self.save_stats(category)
+
+    def recent_anomalies(self, since=None, limit=20, conn=None):
+        query = '''
+            SELECT date, category, amount, description, score, typical
+            FROM expense_anomalies
+        '''
+        params = []
+        if since:
+            query += ' WHERE date >= ?'
+            params.append(since)
+        query += ' ORDER BY date DESC, expense_id DESC LIMIT ?'
+        params.append(limit)
+        return (conn or self.conn).execute(query, params).fetchall()
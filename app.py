@@ -8,6 +8,16 @@ import pandas as pd
 import json
 from tkcalendar import DateEntry
 import os
+from anomaly import AnomalyDetector
+from recurring import RecurringExpenses
+from budgets import BudgetHistory
+from fx import FxLookup, FxRates
+from records import record_factory, iter_records, iter_pages
+from readers import ReaderPool, open_reader
+from autocomplete import DescriptionIndex
+from heatmap import load_rollup, month_grid, year_grid
+from ingest import read_metrics
+import numpy as np
 
 class ExpenseTracker:
     def __init__(self):
@@ -43,11 +53,16 @@ class ExpenseTracker:
         # Bind closing event
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
+        # Pick up rows written by the ingest daemon
+        self.root.after(1000, self.poll_external_changes)
+        
     def load_settings(self):
         self.settings_file = 'expense_settings.json'
+        self.saved_settings = None
         if os.path.exists(self.settings_file):
             with open(self.settings_file, 'r') as f:
                 self.settings = json.load(f)
+            self.saved_settings = json.dumps(self.settings)
         else:
             self.settings = {
                 'budgets': {
@@ -67,12 +82,28 @@ class ExpenseTracker:
             self.save_settings()
             
     def save_settings(self):
-        with open(self.settings_file, 'w') as f:
-            json.dump(self.settings, f)
+        # Skip the write when nothing changed since the last load or save
+        data = json.dumps(self.settings)
+        if data == self.saved_settings:
+            return
+        
+        # Write to a temporary file and swap it in so a crash never
+        # leaves a truncated settings file behind
+        tmp_file = self.settings_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.settings_file)
+        self.saved_settings = data
             
     def setup_database(self):
-        self.conn = sqlite3.connect('expenses.db')
+        self.db_file = 'expenses.db'
+        self.conn = sqlite3.connect(self.db_file)
         self.cursor = self.conn.cursor()
+        
+        # WAL lets the read-only connections below read while this one writes
+        self.cursor.execute('PRAGMA journal_mode = WAL')
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS expenses (
                 id INTEGER PRIMARY KEY,
@@ -85,6 +116,41 @@ class ExpenseTracker:
         ''')
         self.conn.commit()
         
+        # Exchange rates into the reporting currency
+        self.settings.setdefault('currency', 'USD')
+        self.fx = FxRates(self.conn, self.settings['currency'])
+        if self.fx.load_error:
+            self.root.after(0, self.show_alert, "Exchange Rates", self.fx.load_error)
+        
+        # Per-category running statistics for unusual expense detection
+        self.anomaly_detector = AnomalyDetector(self.conn)
+        
+        # Recurring rules, materialized up to today
+        self.recurring = RecurringExpenses(self.conn, self.anomaly_detector,
+                                           self.settings['currency'])
+        self.materialize_recurring()
+        
+        # Budgets with the month they take effect; older settings files
+        # carried a flat budgets dict, which becomes the initial history
+        self.budget_history = BudgetHistory(self.conn)
+        if 'budgets' in self.settings:
+            if self.budget_history.is_empty():
+                self.budget_history.seed(self.settings['budgets'])
+            del self.settings['budgets']
+            self.save_settings()
+        
+        # Read-only connections for summaries, trends, filters and exports
+        self.readers = ReaderPool(self.db_file)
+        
+        # Description completions, built in the background from past expenses
+        self.description_index = DescriptionIndex()
+        self.last_indexed_id = self.cursor.execute(
+            'SELECT COALESCE(MAX(id), 0) FROM expenses').fetchone()[0]
+        self.description_index.load_in_background(lambda: open_reader(self.db_file))
+        
+        # Changes when another connection commits to the ledger
+        self.data_version = self.cursor.execute('PRAGMA data_version').fetchone()[0]
+        
     def create_frames(self):
         # Top frame for filters
         self.filter_frame = ctk.CTkFrame(self.root)
@@ -123,6 +189,13 @@ class ExpenseTracker:
                                                  variable=self.category_var)
         self.category_dropdown.pack(padx=10, pady=5, fill="x")
         
+        # Currency dropdown, reporting currency first
+        self.currency_var = ctk.StringVar(value=self.settings['currency'])
+        self.currency_dropdown = ctk.CTkOptionMenu(self.left_frame,
+                                                 values=self.fx.currencies(),
+                                                 variable=self.currency_var)
+        self.currency_dropdown.pack(padx=10, pady=5, fill="x")
+        
         # Amount entry
         self.amount_entry = ctk.CTkEntry(self.left_frame, placeholder_text="Amount")
         self.amount_entry.pack(padx=10, pady=5, fill="x")
@@ -131,6 +204,33 @@ class ExpenseTracker:
         self.description_entry = ctk.CTkEntry(self.left_frame, 
                                             placeholder_text="Description")
         self.description_entry.pack(padx=10, pady=5, fill="x")
+        self.description_entry.bind("<KeyRelease>", self.update_suggestions)
+        self.description_entry.bind("<Tab>", self.accept_suggestion)
+        
+        # Completions for the description; Tab takes the first one
+        self.suggestions = []
+        self.suggestion_label = ctk.CTkLabel(self.left_frame, text="", anchor="w",
+                                           justify="left")
+        self.suggestion_label.pack(padx=10, fill="x")
+        
+        # Repeat options for bills and subscriptions
+        self.repeat_var = ctk.StringVar(value="Once")
+        self.repeat_dropdown = ctk.CTkOptionMenu(self.left_frame,
+                                               values=["Once", "Daily", "Weekly", "Monthly"],
+                                               variable=self.repeat_var)
+        self.repeat_dropdown.pack(padx=10, pady=5, fill="x")
+        
+        # Every N days/weeks/months, e.g. Daily + 10 for every ten days
+        self.repeat_interval_entry = ctk.CTkEntry(self.left_frame,
+                                                placeholder_text="Repeat every (default 1)")
+        self.repeat_interval_entry.pack(padx=10, pady=5, fill="x")
+        
+        self.repeat_until_entry = ctk.CTkEntry(self.left_frame,
+                                             placeholder_text="Repeat until (YYYY-MM-DD)")
+        self.repeat_until_entry.pack(padx=10, pady=5, fill="x")
+        
+        ctk.CTkButton(self.left_frame, text="Recurring Expenses...",
+                     command=self.show_recurring_rules).pack(padx=10, pady=5, fill="x")
         
         # Add button
         self.add_button = ctk.CTkButton(self.left_frame, text="Add Expense",
@@ -172,6 +272,10 @@ class ExpenseTracker:
                                       command=self.export_to_csv)
         self.export_btn.pack(side="right", padx=5)
         
+        # Ingest daemon status
+        self.ingest_label = ctk.CTkLabel(self.filter_frame, text="")
+        self.ingest_label.pack(side="right", padx=5)
+        
     def create_display_widgets(self):
         # List section title
         ctk.CTkLabel(self.list_frame, text="Recent Expenses",
@@ -196,13 +300,15 @@ class ExpenseTracker:
         
         # Budget entries for each category
         self.budget_entries = {}
+        with self.readers.connection() as conn:
+            budgets = self.budget_history.current(conn)
         for category in self.settings['categories']:
             frame = ctk.CTkFrame(self.budget_frame)
             frame.pack(fill="x", padx=5, pady=2)
             
             ctk.CTkLabel(frame, text=category).pack(side="left")
             entry = ctk.CTkEntry(frame, width=100)
-            entry.insert(0, str(self.settings['budgets'][category]))
+            entry.insert(0, str(budgets.get(category, 0)))
             entry.pack(side="right", padx=5)
             self.budget_entries[category] = entry
             
@@ -219,6 +325,7 @@ class ExpenseTracker:
         self.notebook.add("Summary")
         self.notebook.add("Trends")
         self.notebook.add("Categories")
+        self.notebook.add("Calendar")
         
         # Summary tab
         self.summary_text = ctk.CTkTextbox(self.notebook.tab("Summary"))
@@ -236,53 +343,252 @@ class ExpenseTracker:
                                            master=self.notebook.tab("Categories"))
         self.canvas_pie.get_tk_widget().pack(fill="both", expand=True)
         
+        # Calendar tab - daily spend heatmap for a month or a year
+        calendar_tab = self.notebook.tab("Calendar")
+        controls = ctk.CTkFrame(calendar_tab)
+        controls.pack(fill="x", padx=5, pady=5)
+        
+        ctk.CTkButton(controls, text="<", width=30,
+                     command=lambda: self.shift_heatmap(-1)).pack(side="left", padx=2)
+        self.heatmap_label = ctk.CTkLabel(controls, text="", width=90)
+        self.heatmap_label.pack(side="left", padx=2)
+        ctk.CTkButton(controls, text=">", width=30,
+                     command=lambda: self.shift_heatmap(1)).pack(side="left", padx=2)
+        
+        self.heatmap_mode_var = ctk.StringVar(value="Month")
+        ctk.CTkOptionMenu(controls, values=["Month", "Year"], width=80,
+                         variable=self.heatmap_mode_var,
+                         command=lambda _: self.update_heatmap()).pack(side="left", padx=2)
+        
+        self.heatmap_category_var = ctk.StringVar(value="All Categories")
+        ctk.CTkOptionMenu(controls, values=["All Categories"] + self.settings['categories'],
+                         variable=self.heatmap_category_var,
+                         command=lambda _: self.update_heatmap()).pack(side="left", padx=2)
+        
+        self.fig_heatmap, self.ax_heatmap = plt.subplots(figsize=(6, 4))
+        self.canvas_heatmap = FigureCanvasTkAgg(self.fig_heatmap, master=calendar_tab)
+        self.canvas_heatmap.get_tk_widget().pack(fill="both", expand=True)
+        self.heatmap_image = None
+        self.heatmap_rollups = {}
+        today = datetime.now()
+        self.heatmap_year, self.heatmap_month = today.year, today.month
+        
     def add_expense(self):
         try:
             date = self.date_entry.get_date().strftime('%Y-%m-%d')
             category = self.category_var.get()
             amount = float(self.amount_entry.get())
             description = self.description_entry.get()
+            currency = self.currency_var.get()
+            repeat = self.repeat_var.get()
+            
+            base_amount = self.fx.convert(amount, currency, date)
+            if base_amount is None:
+                self.show_error(f"No exchange rate for {currency} on {date}")
+                return
+            
+            if repeat != "Once":
+                if currency != self.settings['currency']:
+                    self.show_error(f"Recurring expenses must be in {self.settings['currency']}")
+                    return
+                
+                # Store a rule and let it fill in the dates up to today
+                end_date = self.repeat_until_entry.get().strip() or None
+                if end_date:
+                    try:
+                        end_date = datetime.strptime(end_date, '%Y-%m-%d').strftime('%Y-%m-%d')
+                    except ValueError:
+                        self.show_error("Repeat until must be a date as YYYY-MM-DD")
+                        return
+                try:
+                    interval = int(self.repeat_interval_entry.get().strip() or 1)
+                except ValueError:
+                    self.show_error("Repeat every must be a whole number")
+                    return
+                try:
+                    self.recurring.add_rule(category, amount, description, date,
+                                            repeat.lower(), interval, end_date)
+                except ValueError as e:
+                    self.show_error(str(e))
+                    return
+                self.materialize_recurring()
+                self.index_new_rows()
+                
+                self.amount_entry.delete(0, 'end')
+                self.description_entry.delete(0, 'end')
+                self.repeat_until_entry.delete(0, 'end')
+                self.repeat_interval_entry.delete(0, 'end')
+                self.repeat_var.set("Once")
+                self.clear_suggestions()
+                
+                self.load_expenses()
+                self.update_summary()
+                self.check_budget_alerts()
+                return
             
             # Insert into database
             self.cursor.execute('''
-                INSERT INTO expenses (date, category, amount, description)
-                VALUES (?, ?, ?, ?)
-            ''', (date, category, amount, description))
+                INSERT INTO expenses (date, category, amount, description, currency)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (date, category, amount, description, currency))
+            typical = self.anomaly_detector.observe(self.cursor.lastrowid, date,
+                                                    category, base_amount, description)
             self.conn.commit()
+            self.index_new_rows()
             
             # Clear entries
             self.amount_entry.delete(0, 'end')
             self.description_entry.delete(0, 'end')
+            self.clear_suggestions()
             
             # Refresh display
             self.load_expenses()
             self.update_summary()
             self.check_budget_alerts()
             
+            if typical is not None:
+                self.show_alert("Unusual Expense",
+                              f"{category}: ${base_amount:.2f} is far above the usual "
+                              f"${typical:.2f} for this category")
+            
         except ValueError:
             self.show_error("Please enter a valid amount")
             
+    def index_new_rows(self):
+        # Add expenses newer than the last indexed id to the completions
+        self.cursor.execute('''
+            SELECT id, description, category, date
+            FROM expenses
+            WHERE id > ?
+            ORDER BY id
+        ''', (self.last_indexed_id,))
+        for expense_id, description, category, date in iter_records(self.cursor):
+            if description:
+                self.description_index.add(description, category, date,
+                                           expense_id=expense_id)
+            self.last_indexed_id = expense_id
+        
+    def materialize_recurring(self):
+        self.recurring.materialize_through()
+        self.materialized_day = datetime.now().date()
+        
+    def poll_external_changes(self):
+        # A new day brings new recurring occurrences while the app stays open
+        if datetime.now().date() != self.materialized_day:
+            self.materialize_recurring()
+            self.index_new_rows()
+            self.load_expenses()
+            self.update_summary()
+            self.check_budget_alerts()
+            
+        version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if version != self.data_version:
+            self.data_version = version
+            
+            # Another process wrote to the ledger: read only the rows it added
+            with self.readers.connection() as conn:
+                cursor = conn.execute('''
+                    SELECT id, date, category, description, currency, base_amount
+                    FROM expenses_converted
+                    WHERE id > ?
+                    ORDER BY id
+                ''', (min(self.last_indexed_id, self.summary_id),))
+                self.apply_new_rows(iter_records(cursor))
+                metrics = read_metrics(conn)
+            if metrics:
+                self.ingest_label.configure(
+                    text=f"Ingest: {int(metrics['rows'])} rows, "
+                         f"{metrics['rows_per_sec']:.0f}/s, lag {metrics['lag']:.1f}s"
+                         + (f", {int(metrics['rejected'])} files skipped"
+                            if metrics.get('rejected') else ""))
+        self.root.after(1000, self.poll_external_changes)
+        
+    def apply_new_rows(self, rows):
+        # Fold rows committed by another process into the completions and the
+        # running totals, then redraw only what they touch
+        years = set()
+        newest = ''
+        trends_changed = False
+        for expense_id, date, category, description, currency, base_amount in rows:
+            if expense_id > self.last_indexed_id:
+                if description:
+                    self.description_index.add(description, category, date,
+                                               expense_id=expense_id)
+                self.last_indexed_id = expense_id
+            if expense_id <= self.summary_id:
+                continue
+            self.summary_id = expense_id
+            newest = max(newest, date)
+            if base_amount is None:
+                self.missing_counts[currency] = self.missing_counts.get(currency, 0) + 1
+                continue
+            self.category_totals[category] = self.category_totals.get(category, 0) + base_amount
+            if date >= self.trends_start:
+                self.daily_totals[date] = self.daily_totals.get(date, 0) + base_amount
+                trends_changed = True
+            years.add(int(date[:4]))
+        if not newest:
+            return
+        
+        # The list only changes if a new row sorts into the newest 50
+        if newest >= self.list_floor:
+            self.load_expenses()
+        self.draw_summary()
+        if trends_changed:
+            self.update_trends_chart()
+        for year in years:
+            self.heatmap_rollups.pop(year, None)
+        if self.heatmap_year in years:
+            self.update_heatmap()
+        
+    def update_suggestions(self, event=None):
+        if event is not None and event.keysym == "Tab":
+            return
+        self.suggestions = self.description_index.suggest(self.description_entry.get())
+        self.suggestion_label.configure(text="\n".join(
+            f"{description} ({category})" for description, category in self.suggestions))
+        
+    def accept_suggestion(self, event=None):
+        if not self.suggestions:
+            return
+        # Fill in the best completion and its most likely category
+        description, category = self.suggestions[0]
+        self.description_entry.delete(0, 'end')
+        self.description_entry.insert(0, description)
+        if category in self.settings['categories']:
+            self.category_var.set(category)
+        self.clear_suggestions()
+        return "break"
+        
+    def clear_suggestions(self):
+        self.suggestions = []
+        self.suggestion_label.configure(text="")
+        
     def load_expenses(self):
         # Clear current display
         self.expenses_text.delete('1.0', 'end')
         
         # Get expenses from database
-        self.cursor.execute('''
-            SELECT date, category, amount, description
-            FROM expenses
-            ORDER BY date DESC
-            LIMIT 50
-        ''')
+        with self.readers.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = record_factory
+            cursor.execute('''
+                SELECT date, category, amount, description, currency, base_amount
+                FROM expenses_converted
+                ORDER BY date DESC
+                LIMIT 50
+            ''')
+            records = cursor.fetchall()
+            
+        # Oldest date shown; rows added before it would not appear in the list
+        self.list_floor = records[-1].date if len(records) == 50 else ''
         
-        # Display expenses
-        for expense in self.cursor.fetchall():
-            self.expenses_text.insert('end',
-                f"Date: {expense[0]}\n"
-                f"Category: {expense[1]}\n"
-                f"Amount: ${expense[2]:.2f}\n"
-                f"Description: {expense[3]}\n"
-                f"{'-'*40}\n"
-            )
+        # Display expenses, one text insert per page of records
+        self.insert_records(records)
+        
+    def insert_records(self, records):
+        for page in iter_pages(records, self.settings['currency']):
+            self.expenses_text.insert('end', page)
             
     def delete_expense(self):
         try:
@@ -292,6 +598,11 @@ class ExpenseTracker:
             amount = float(lines[2].split('$')[1])
             
             # Delete from database
+            self.cursor.execute('''
+                SELECT id FROM expenses
+                WHERE date = ? AND amount = ?
+            ''', (date, amount))
+            self.anomaly_detector.forget([row[0] for row in self.cursor.fetchall()])
             self.cursor.execute('''
                 DELETE FROM expenses
                 WHERE date = ? AND amount = ?
@@ -312,8 +623,8 @@ class ExpenseTracker:
         category = self.filter_category_var.get()
         
         query = '''
-            SELECT date, category, amount, description
-            FROM expenses
+            SELECT date, category, amount, description, currency, base_amount
+            FROM expenses_converted
             WHERE date BETWEEN ? AND ?
         '''
         params = [start_date, end_date]
@@ -328,86 +639,180 @@ class ExpenseTracker:
             
         query += ' ORDER BY date DESC'
         
-        self.cursor.execute(query, params)
-        self.display_filtered_results(self.cursor.fetchall())
+        with self.readers.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = record_factory
+            cursor.execute(query, params)
+            self.display_filtered_results(iter_records(cursor))
         
     def display_filtered_results(self, results):
         self.expenses_text.delete('1.0', 'end')
-        for expense in results:
-            self.expenses_text.insert('end',
-                f"Date: {expense[0]}\n"
-                f"Category: {expense[1]}\n"
-                f"Amount: ${expense[2]:.2f}\n"
-                f"Description: {expense[3]}\n"
-                f"{'-'*40}\n"
-            )
+        self.insert_records(results)
         self.update_summary()
         
     def export_to_csv(self):
-        df = pd.read_sql_query('''
-            SELECT date, category, amount, description
-            FROM expenses
-            ORDER BY date DESC
-        ''', self.conn)
+        with self.readers.connection() as conn:
+            df = pd.read_sql_query('''
+                SELECT date, category, amount, currency, base_amount, description
+                FROM expenses_converted
+                ORDER BY date DESC
+            ''', conn)
         
         filename = f"expenses_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         df.to_csv(filename, index=False)
         self.show_message("Export Successful", f"Data exported to {filename}")
         
     def save_budgets(self):
+        budgets = {}
         for category, entry in self.budget_entries.items():
             try:
-                self.settings['budgets'][category] = float(entry.get())
+                budgets[category] = float(entry.get())
             except ValueError:
                 self.show_error(f"Invalid budget value for {category}")
                 return
         
-        self.save_settings()
+        # New amounts take effect from the current month onwards
+        if not self.budget_history.set_budgets(budgets):
+            self.show_message("Budgets", "No budget changes to save")
+            return
         self.show_message("Success", "Budgets saved successfully!")
         self.check_budget_alerts()
         
     def check_budget_alerts(self):
         # Get current month's expenses
         current_month = datetime.now().strftime('%Y-%m')
-        self.cursor.execute('''
-            SELECT category, SUM(amount)
-            FROM expenses
-            WHERE date LIKE ?
-            GROUP BY category
-        ''', (current_month + '%',))
-        
-        expenses = dict(self.cursor.fetchall())
+        with self.readers.connection() as conn:
+            expenses = dict(conn.execute('''
+                SELECT category, SUM(base_amount)
+                FROM expenses_converted
+                WHERE date LIKE ? AND base_amount IS NOT NULL
+                GROUP BY category
+            ''', (current_month + '%',)).fetchall())
+            
+            # Recurring spend still due later this month
+            upcoming = self.upcoming_recurring(conn)
+            budgets = self.budget_history.budgets_for(current_month, conn)
         
         # Check each category
         alerts = []
-        for category, budget in self.settings['budgets'].items():
+        for category, budget in budgets.items():
             if category in expenses and expenses[category] > budget:
                 alerts.append(f"{category}: ${expenses[category]:.2f} / ${budget:.2f}")
+            elif category in upcoming:
+                projected = expenses.get(category, 0) + upcoming[category]
+                if projected > budget:
+                    alerts.append(f"{category}: ${projected:.2f} / ${budget:.2f} "
+                                  f"(projected with recurring)")
                 
         if alerts:
             self.show_alert("Budget Alerts",
                           "The following categories are over budget:\n\n" +
                           "\n".join(alerts))
             
-    def update_summary(self):
-        # Calculate total expenses
-        self.cursor.execute('SELECT SUM(amount) FROM expenses')
-        total = self.cursor.fetchone()[0] or 0
+    def show_recurring_rules(self):
+        dialog = ctk.CTkToplevel(self.root)
+        dialog.title("Recurring Expenses")
+        dialog.geometry("560x360")
+        
+        rules_frame = ctk.CTkScrollableFrame(dialog)
+        rules_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        
+        def refresh():
+            for widget in rules_frame.winfo_children():
+                widget.destroy()
+            with self.readers.connection() as conn:
+                rules = self.recurring.rules(conn)
+            if not rules:
+                ctk.CTkLabel(rules_frame, text="No recurring expenses").pack(pady=10)
+            for (rule_id, category, amount, description, frequency, interval,
+                 start_date, end_date, _, _) in rules:
+                row = ctk.CTkFrame(rules_frame)
+                row.pack(fill="x", padx=5, pady=2)
+                every = frequency if interval == 1 else f"every {interval} {frequency}"
+                text = f"{description or category}: ${amount:.2f} {every}, from {start_date}"
+                if end_date:
+                    text += f" until {end_date}"
+                ctk.CTkLabel(row, text=text, anchor="w").pack(side="left", padx=5)
+                ctk.CTkButton(row, text="Delete", width=60,
+                             command=lambda r=rule_id: action(self.recurring.delete_rule, r)
+                             ).pack(side="right", padx=2)
+                ctk.CTkButton(row, text="End", width=60,
+                             command=lambda r=rule_id: action(self.recurring.end_rule, r)
+                             ).pack(side="right", padx=2)
+        
+        def action(func, rule_id):
+            # Rows already added to the ledger stay; only future ones stop
+            func(rule_id)
+            refresh()
+            self.update_summary()
         
-        # Calculate expenses by category
-        self.cursor.execute('''
-            SELECT category, SUM(amount)
-            FROM expenses
-            GROUP BY category
-        ''')
-        category_totals = self.cursor.fetchall()
+        refresh()
         
-        # Update summary text
-        self.summary_text.delete('1.0', 'end')
-        self.summary_text.insert('end', f"Total Expenses: ${total:.2f}\n\n")
+    def upcoming_recurring(self, conn):
+        # Recurring totals from tomorrow to the end of the month, expanded
+        # on the fly rather than written to the ledger; read through `conn`
+        today = datetime.now().date()
+        month_end = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+        if today >= month_end:
+            return {}
+        fx = FxLookup(conn, self.fx.base_currency)
+        return self.recurring.projected_totals(today + timedelta(days=1), month_end,
+                                               fx.convert, conn)
+        
+    def update_summary(self):
+        # Re-read every total from the ledger and redraw the whole tab
+        self.load_summary_totals()
+        self.draw_summary()
+        self.update_trends_chart()
+        
+        # Daily rollups are re-read on the next heatmap draw
+        self.heatmap_rollups.clear()
+        self.update_heatmap()
+        
+    def load_summary_totals(self):
+        # Running totals behind the summary, pie and trends chart, read in one
+        # snapshot together with the newest id they cover; rows written by
+        # other processes are added to them by apply_new_rows
+        self.trends_start = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+        with self.readers.connection() as conn:
+            conn.execute('BEGIN')
+            try:
+                self.summary_id = conn.execute(
+                    'SELECT COALESCE(MAX(id), 0) FROM expenses').fetchone()[0]
+                self.category_totals = dict(conn.execute('''
+                    SELECT category, SUM(base_amount)
+                    FROM expenses_converted
+                    WHERE base_amount IS NOT NULL
+                    GROUP BY category
+                ''').fetchall())
+                self.missing_counts = dict(self.fx.missing_rates(conn))
+                self.daily_totals = dict(conn.execute('''
+                    SELECT date, SUM(base_amount)
+                    FROM expenses_converted
+                    WHERE date >= ? AND base_amount IS NOT NULL
+                    GROUP BY date
+                ''', (self.trends_start,)).fetchall())
+            finally:
+                conn.rollback()
+        
+    def draw_summary(self):
+        # Summary text and pie chart from the running totals; budgets,
+        # recurring rules and flagged expenses are small and read each time
+        with self.readers.connection() as conn:
+            budgets = self.budget_history.current(conn)
+            upcoming = self.upcoming_recurring(conn)
+            anomalies = self.anomaly_detector.recent_anomalies(limit=10, conn=conn)
+        category_totals = sorted(self.category_totals.items())
+        total = sum(amount for _, amount in category_totals)
+        
+        # Build the summary text and insert it in one go
+        parts = [f"Total Expenses: ${total:.2f}\n\n"]
+        for currency, count in sorted(self.missing_counts.items()):
+            parts.append(f"{count} {currency} expenses have no exchange rate "
+                         f"and are not counted\n\n")
         for category, amount in category_totals:
-            budget = self.settings['budgets'].get(category, 0)
-            self.summary_text.insert('end',
+            budget = budgets.get(category, 0)
+            parts.append(
                 f"{category}:\n"
                 f"  Spent: ${amount:.2f}\n"
                 f"  Budget: ${budget:.2f}\n"
@@ -415,6 +820,25 @@ class ExpenseTracker:
                 f"${abs(amount - budget):.2f}\n\n"
             )
             
+        # Recurring expenses still to come this month
+        if upcoming:
+            parts.append("Upcoming Recurring (this month):\n")
+            for category, amount in sorted(upcoming.items()):
+                parts.append(f"  {category}: ${amount:.2f}\n")
+            parts.append("\n")
+            
+        # Unusual expenses flagged as they were added
+        if anomalies:
+            parts.append("Unusual Expenses:\n")
+            for date, category, amount, description, score, typical in anomalies:
+                parts.append(
+                    f"  {date} {category}: ${amount:.2f} ({description})\n"
+                    f"    usual ${typical:.2f}, {score:.1f} std devs above\n"
+                )
+                
+        self.summary_text.delete('1.0', 'end')
+        self.summary_text.insert('end', ''.join(parts))
+            
         # Update pie chart
         self.ax_pie.clear()
         if category_totals:
@@ -423,21 +847,9 @@ class ExpenseTracker:
             self.ax_pie.set_title("Expenses by Category")
         self.canvas_pie.draw()
         
-        # Update trends chart
-        self.update_trends_chart()
-        
     def update_trends_chart(self):
-        # Get daily totals for the last 30 days
-        thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-        self.cursor.execute('''
-            SELECT date, SUM(amount)
-            FROM expenses
-            WHERE date >= ?
-            GROUP BY date
-            ORDER BY date
-        ''', (thirty_days_ago,))
-        
-        results = self.cursor.fetchall()
+        # Daily totals for the last 30 days, kept by load_summary_totals
+        results = sorted(self.daily_totals.items())
         if results:
             dates, amounts = zip(*results)
             
@@ -455,6 +867,56 @@ class ExpenseTracker:
         
         self.canvas_trends.draw()
         
+    def heatmap_rollup(self, year):
+        # One grouped query per year, kept until the ledger changes
+        if year not in self.heatmap_rollups:
+            with self.readers.connection() as conn:
+                self.heatmap_rollups[year] = load_rollup(conn, year)
+        return self.heatmap_rollups[year]
+        
+    def shift_heatmap(self, step):
+        if self.heatmap_mode_var.get() == "Year":
+            self.heatmap_year += step
+        else:
+            month_index = self.heatmap_year * 12 + self.heatmap_month - 1 + step
+            self.heatmap_year, self.heatmap_month = divmod(month_index, 12)
+            self.heatmap_month += 1
+        self.update_heatmap()
+        
+    def update_heatmap(self):
+        year, month = self.heatmap_year, self.heatmap_month
+        category = self.heatmap_category_var.get()
+        daily = self.heatmap_rollup(year).series(
+            None if category == "All Categories" else category)
+        
+        if self.heatmap_mode_var.get() == "Year":
+            grid = year_grid(daily, year)
+            title = str(year)
+            yticks = list(calendar.day_abbr)
+        else:
+            grid = month_grid(daily, year, month)
+            title = f"{calendar.month_name[month]} {year}"
+            yticks = [f"Week {week + 1}" for week in range(6)]
+        self.heatmap_label.configure(text=title)
+        
+        # The whole calendar is a single image; switching periods only
+        # swaps its data unless the grid shape changes
+        if self.heatmap_image is None or self.heatmap_image.get_array().shape != grid.shape:
+            self.ax_heatmap.clear()
+            self.heatmap_image = self.ax_heatmap.imshow(grid, cmap="Reds", aspect="auto")
+        else:
+            self.heatmap_image.set_data(grid)
+        self.heatmap_image.set_clim(0, max(np.nanmax(grid), 1))
+        
+        if grid.shape == (6, 7):
+            self.ax_heatmap.set_xticks(range(7), list(calendar.day_abbr))
+            self.ax_heatmap.set_yticks(range(6), yticks)
+        else:
+            self.ax_heatmap.set_xticks([])
+            self.ax_heatmap.set_yticks(range(7), yticks)
+        self.ax_heatmap.set_title(f"Daily Expenses - {title}")
+        self.canvas_heatmap.draw_idle()
+        
     def show_message(self, title, message):
         dialog = ctk.CTkToplevel(self.root)
         dialog.title(title)
@@ -463,6 +925,11 @@ class ExpenseTracker:
         ctk.CTkLabel(dialog, text=message).pack(pady=20)
         ctk.CTkButton(dialog, text="OK", command=dialog.destroy).pack()
         
+    def show_error(self, title_or_message, message=None):
+        if message is None:
+            title_or_message, message = "Error", title_or_message
+        self.show_alert(title_or_message, message)
+        
     def show_alert(self, title, message):
         dialog = ctk.CTkToplevel(self.root)
         dialog.title(title)
@@ -473,6 +940,7 @@ class ExpenseTracker:
         
     def on_closing(self):
         self.save_settings()
+        self.readers.close()
         self.conn.close()
         self.root.destroy()
         
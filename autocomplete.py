@@ -0,0 +1,158 @@
+import heapq
+import math
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime
+
+# Past descriptions lose half their weight every this many days
+HALF_LIFE_DAYS = 30
+
+# Best keys kept per typed prefix; larger limits scan the whole match run
+TOP_K = 10
+
+
+def day_number(date):
+    try:
+        return datetime.strptime(date, '%Y-%m-%d').toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+
+class DescriptionEntry:
+    __slots__ = ('text', 'count', 'last_date', 'last_day', 'categories')
+
+    def __init__(self, text):
+        self.text = text
+        self.count = 0
+        self.last_date = ''
+        self.last_day = 0
+        self.categories = {}
+
+    def add(self, category, date, count=1):
+        self.count += count
+        self.categories[category] = self.categories.get(category, 0) + count
+        if date and date > self.last_date:
+            self.last_date = date
+            self.last_day = day_number(date)
+
+    def category(self):
+        return max(self.categories, key=self.categories.get) if self.categories else None
+
+    def rank(self):
+        # log2 of the decayed count, count * 0.5 ** (age / HALF_LIFE_DAYS),
+        # shifted by a term that depends only on today, so ranks compare the
+        # same way on any day
+        return math.log2(self.count) + self.last_day / HALF_LIFE_DAYS
+
+
+class DescriptionIndex:
+    # Sorted array of lowercased descriptions searched with bisect; a
+    # prefix lookup is a binary search plus a scan of the matching run.
+    # The best keys of each prefix typed so far are cached and kept up to
+    # date on add, since adding only ever raises an entry's rank.
+    def __init__(self):
+        self.keys = []
+        self.entries = {}
+        self.top = {}
+        # Highest expense id covered by a background build, and the rows
+        # added while it runs, so only the ones it did not see are folded in
+        self.loaded_id = 0
+        self.pending = []
+        self.ready = False
+        self.lock = threading.Lock()
+
+    def add(self, description, category, date, count=1, expense_id=None):
+        description = description.strip()
+        if not description:
+            return
+        key = description.lower()
+        with self.lock:
+            if expense_id is not None:
+                if self.ready and expense_id <= self.loaded_id:
+                    # Already counted by the build's grouped query
+                    return
+                if not self.ready:
+                    self.pending.append((expense_id, description, category, date))
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = DescriptionEntry(description)
+                insort(self.keys, key)
+            entry.add(category, date, count)
+            for end in range(1, len(key) + 1):
+                best = self.top.get(key[:end])
+                if best is None:
+                    continue
+                if key not in best:
+                    best.append(key)
+                best.sort(key=lambda k: self.entries[k].rank(), reverse=True)
+                del best[TOP_K:]
+
+    def load(self, conn):
+        # Built from per-description aggregates, not individual rows; the
+        # same query reports the newest id it covered
+        rows = conn.execute('''
+            SELECT description, category, COUNT(*), MAX(date), MAX(id)
+            FROM expenses
+            WHERE description IS NOT NULL AND description != ''
+            GROUP BY lower(trim(description)), category
+        ''')
+        keys = set()
+        for description, category, count, last_date, last_id in rows:
+            description = description.strip()
+            key = description.lower()
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = DescriptionEntry(description)
+                keys.add(key)
+            entry.add(category, last_date, count)
+            self.loaded_id = max(self.loaded_id, last_id)
+        self.keys = sorted(set(self.keys) | keys)
+        self.top = {}
+        self.ready = True
+
+    def load_in_background(self, connect, on_ready=None):
+        # Build off the UI thread so a large ledger does not delay startup;
+        # `connect` opens a connection for the worker thread
+        def build():
+            index = DescriptionIndex()
+            conn = connect()
+            try:
+                index.load(conn)
+            finally:
+                conn.close()
+            # Fold in rows added while the build was running that its query
+            # did not already count
+            with self.lock:
+                pending, self.pending = self.pending, []
+                for expense_id, description, category, date in pending:
+                    if expense_id > index.loaded_id:
+                        index.add(description, category, date)
+                self.keys, self.entries, self.top = index.keys, index.entries, {}
+                self.loaded_id, self.ready = index.loaded_id, True
+            if on_ready:
+                on_ready()
+
+        thread = threading.Thread(target=build, daemon=True)
+        thread.start()
+        return thread
+
+    def matches(self, prefix, limit):
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+        return heapq.nlargest(limit, self.keys[start:end],
+                              key=lambda key: self.entries[key].rank())
+
+    def suggest(self, prefix, limit=5):
+        # Best completions for a prefix as (description, category) pairs
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        with self.lock:
+            if limit > TOP_K:
+                best = self.matches(prefix, limit)
+            else:
+                best = self.top.get(prefix)
+                if best is None:
+                    best = self.top[prefix] = self.matches(prefix, TOP_K)
+            return [(self.entries[key].text, self.entries[key].category())
+                    for key in best[:limit]]
@@ -0,0 +1,139 @@
+import gc
+import hashlib
+import sqlite3
+import random
+import sys
+import time
+import tracemalloc
+from records import record_factory, iter_records, iter_pages
+
+# Compares the old list path (fetchall of tuples, one f-string and one
+# insert per row) with slotted records streamed from the cursor and
+# inserted one page at a time. Both paths produce the same text. Text
+# inserts are counted instead of going to a widget, so this runs without a
+# display; the memory figures therefore leave out the text a real textbox
+# keeps, which is the same for both paths.
+#
+# "blocks" is the most allocated blocks held at once above the starting
+# point (sys.getallocatedblocks), not a count of every allocation made.
+# On its own the new path is somewhat slower: each row builds an
+# ExpenseRecord through the row factory and formats through a method call,
+# where the old path keeps the tuple and one inline f-string. What it buys
+# is flat memory and 50x fewer inserts; the per-insert cost of a real Tk
+# textbox is not part of this measurement.
+
+ROWS = 200000
+
+# Mostly reporting-currency rows, with some converted and some unconvertible
+CURRENCIES = [None] * 8 + ['EUR', 'GBP']
+
+
+def build_ledger(rows):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''
+        CREATE TABLE expenses (
+            date TEXT,
+            category TEXT,
+            amount REAL,
+            description TEXT,
+            currency TEXT,
+            base_amount REAL
+        )
+    ''')
+    categories = ['Food', 'Transport', 'Bills', 'Entertainment', 'Shopping', 'Health', 'Other']
+    conn.executemany('INSERT INTO expenses VALUES (?, ?, ?, ?, ?, ?)', (
+        (f"2025-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+         random.choice(categories), amount, f"Expense {i}", currency,
+         amount * 1.1 if currency == 'EUR' else None)
+        for i in range(rows)
+        for amount in [random.random() * 100]
+        for currency in [random.choice(CURRENCIES)]))
+    return conn
+
+
+QUERY = 'SELECT date, category, amount, description, currency, base_amount FROM expenses ORDER BY date DESC'
+
+
+def old_path(conn, sink):
+    cursor = conn.cursor()
+    cursor.execute(QUERY)
+    for expense in cursor.fetchall():
+        if expense[4] is None or expense[4] == 'USD':
+            currency_line = ""
+        elif expense[5] is None:
+            currency_line = f"Currency: {expense[4]} (no rate)\n"
+        else:
+            currency_line = f"Currency: {expense[4]} (= ${expense[5]:.2f})\n"
+        sink.append(
+            f"Date: {expense[0]}\n"
+            f"Category: {expense[1]}\n"
+            f"Amount: ${expense[2]:.2f}\n"
+            f"Description: {expense[3]}\n"
+            f"{currency_line}"
+            f"{'-'*40}\n"
+        )
+
+
+def new_path(conn, sink):
+    cursor = conn.cursor()
+    cursor.row_factory = record_factory
+    cursor.execute(QUERY)
+    for page in iter_pages(iter_records(cursor), 'USD'):
+        sink.append(page)
+
+
+# Timed runs per path; the fastest and slowest are reported
+REPEAT = 3
+
+
+class InsertCounter:
+    # Stands in for the text widget: counts inserts and keeps no text.
+    # With `track` it also hashes the text, to compare the two paths, and
+    # samples sys.getallocatedblocks() on every insert to find the most
+    # blocks held at once.
+    def __init__(self, track=False):
+        self.inserts = 0
+        self.chars = 0
+        self.track = track
+        self.digest = hashlib.sha1()
+        self.peak_blocks = sys.getallocatedblocks()
+
+    def append(self, text):
+        self.inserts += 1
+        self.chars += len(text)
+        if self.track:
+            self.digest.update(text.encode())
+            self.peak_blocks = max(self.peak_blocks, sys.getallocatedblocks())
+
+
+def measure(name, func, conn):
+    # Untraced timing runs, then one run counting allocated blocks and one
+    # under tracemalloc for the peak bytes
+    times = []
+    for _ in range(REPEAT):
+        sink = InsertCounter()
+        start = time.perf_counter()
+        func(conn, sink)
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    baseline = sys.getallocatedblocks()
+    counted = InsertCounter(track=True)
+    func(conn, counted)
+
+    tracemalloc.start()
+    func(conn, InsertCounter())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<6} {min(times):6.2f}-{max(times):.2f}s  peak {peak / 1024 / 1024:8.1f} MiB  "
+          f"blocks {counted.peak_blocks - baseline:>9}  inserts {sink.inserts:>8}  "
+          f"chars {sink.chars}")
+    return counted.digest.hexdigest()
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    conn = build_ledger(ROWS)
+    old = measure("old", old_path, conn)
+    new = measure("new", new_path, conn)
+    print("output identical" if old == new else "output differs")
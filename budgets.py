@@ -0,0 +1,94 @@
+from datetime import datetime
+
+# Budgets that were in effect before any history was recorded
+EARLIEST_PERIOD = '0000-01'
+
+
+class BudgetHistory:
+    # Monthly budgets stored per category with the month they take effect.
+    # Changing a budget adds a row for the current month instead of
+    # rewriting earlier months.
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS budget_history (
+                category TEXT,
+                effective_from TEXT,
+                amount REAL,
+                PRIMARY KEY (category, effective_from)
+            )
+        ''')
+        self.conn.commit()
+
+    def is_empty(self):
+        return self.conn.execute('SELECT 1 FROM budget_history LIMIT 1').fetchone() is None
+
+    def seed(self, budgets):
+        # Import the old flat settings budgets as the starting point
+        with self.conn:
+            self.conn.executemany('''
+                INSERT OR IGNORE INTO budget_history (category, effective_from, amount)
+                VALUES (?, ?, ?)
+            ''', [(category, EARLIEST_PERIOD, float(amount))
+                  for category, amount in budgets.items()])
+
+    def budgets_for(self, month, conn=None):
+        # `conn` lets callers read through a reader connection instead
+        rows = (conn or self.conn).execute('''
+            SELECT b.category, b.amount
+            FROM budget_history b
+            WHERE b.effective_from = (
+                SELECT MAX(effective_from)
+                FROM budget_history
+                WHERE category = b.category AND effective_from <= ?
+            )
+        ''', (month,))
+        return dict(rows.fetchall())
+
+    def current(self, conn=None):
+        return self.budgets_for(datetime.now().strftime('%Y-%m'), conn)
+
+    def set_budgets(self, budgets, effective_from=None):
+        # Only categories whose amount actually changes get a new row;
+        # returns the categories that changed
+        effective_from = effective_from or datetime.now().strftime('%Y-%m')
+        existing = self.budgets_for(effective_from)
+        changed = [(category, effective_from, float(amount))
+                   for category, amount in budgets.items()
+                   if existing.get(category) != float(amount)]
+        if changed:
+            with self.conn:
+                self.conn.executemany('''
+                    INSERT OR REPLACE INTO budget_history (category, effective_from, amount)
+                    VALUES (?, ?, ?)
+                ''', changed)
+        return [category for category, _, _ in changed]
+
+    def budget_vs_actual(self):
+        # Every month with spending crossed with every known category,
+        # joined to the budget in effect for that month, in one query
+        return self.conn.execute('''
+            WITH actual AS (
+                SELECT substr(date, 1, 7) AS month, category, SUM(base_amount) AS spent
+                FROM expenses_converted
+                WHERE base_amount IS NOT NULL
+                GROUP BY month, category
+            ),
+            months AS (SELECT DISTINCT month FROM actual),
+            categories AS (
+                SELECT category FROM actual
+                UNION
+                SELECT category FROM budget_history
+            ),
+            grid AS (
+                SELECT m.month, c.category,
+                       (SELECT MAX(effective_from) FROM budget_history
+                        WHERE category = c.category AND effective_from <= m.month) AS since
+                FROM months m CROSS JOIN categories c
+            )
+            SELECT g.month, g.category, COALESCE(a.spent, 0), b.amount
+            FROM grid g
+            LEFT JOIN actual a ON a.month = g.month AND a.category = g.category
+            LEFT JOIN budget_history b ON b.category = g.category AND b.effective_from = g.since
+            ORDER BY g.month, g.category
+        ''').fetchall()
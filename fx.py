@@ -0,0 +1,144 @@
+import csv
+import os
+
+DEFAULT_RATES_FILE = 'fx_rates.csv'
+
+
+class FxLookup:
+    # Read-only rate lookups against tables an FxRates has set up; safe on
+    # reader connections. The reporting currency defaults to the stored one.
+    def __init__(self, conn, base_currency=None):
+        self.conn = conn
+        if base_currency is None:
+            row = conn.execute(
+                "SELECT value FROM fx_meta WHERE key = 'base_currency'").fetchone()
+            base_currency = row[0] if row else None
+        self.base_currency = base_currency
+        self.rate_cache = {}
+
+    def rate(self, currency, date):
+        # Single lookups for the entry form, cached per (currency, date)
+        if not currency or currency == self.base_currency:
+            return 1.0
+        key = (currency, date)
+        if key not in self.rate_cache:
+            row = self.conn.execute('''
+                SELECT rate FROM fx_rates
+                WHERE currency = ? AND date <= ?
+                ORDER BY date DESC
+                LIMIT 1
+            ''', key).fetchone()
+            self.rate_cache[key] = row[0] if row else None
+        return self.rate_cache[key]
+
+    def convert(self, amount, currency, date):
+        rate = self.rate(currency, date)
+        return None if rate is None else amount * rate
+
+
+class FxRates(FxLookup):
+    # Local exchange rate table. Rates come from a CSV file with
+    # date,currency,rate columns, where rate is the value of one unit of the
+    # currency in the reporting currency on that date. Conversion happens in
+    # SQL through the expenses_converted view, using the latest rate on or
+    # before each expense date.
+    def __init__(self, conn, base_currency='USD', rates_file=DEFAULT_RATES_FILE):
+        super().__init__(conn, base_currency)
+        self.rates_file = rates_file
+        # Why the last load of the rates file failed, if it did
+        self.load_error = None
+        self.setup_tables()
+        self.load_file()
+
+    def setup_tables(self):
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(expenses)')]
+        if 'currency' not in columns:
+            # Existing rows were entered in the reporting currency of the time;
+            # record it so a later change of reporting currency keeps them as is
+            self.conn.execute('ALTER TABLE expenses ADD COLUMN currency TEXT')
+            self.conn.execute('UPDATE expenses SET currency = ?', (self.base_currency,))
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS fx_rates (
+                currency TEXT,
+                date TEXT,
+                rate REAL,
+                PRIMARY KEY (currency, date)
+            ) WITHOUT ROWID
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS fx_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        self.conn.execute('''
+            INSERT OR REPLACE INTO fx_meta (key, value) VALUES ('base_currency', ?)
+        ''', (self.base_currency,))
+        self.conn.execute('''
+            CREATE VIEW IF NOT EXISTS expenses_converted AS
+            SELECT e.id, e.date, e.category, e.amount, e.description,
+                   COALESCE(e.currency, m.value) AS currency,
+                   CASE
+                       WHEN e.currency IS NULL OR e.currency = m.value THEN e.amount
+                       ELSE e.amount * (
+                           SELECT r.rate FROM fx_rates r
+                           WHERE r.currency = e.currency AND r.date <= e.date
+                           ORDER BY r.date DESC
+                           LIMIT 1
+                       )
+                   END AS base_amount
+            FROM expenses e
+            JOIN fx_meta m ON m.key = 'base_currency'
+        ''')
+        self.conn.commit()
+
+    def load_file(self):
+        # Reload only when the rates file has changed since the last load. A
+        # malformed file is reported in load_error and the previous rates kept.
+        if not os.path.exists(self.rates_file):
+            return False
+        mtime = str(os.path.getmtime(self.rates_file))
+        loaded = self.conn.execute(
+            "SELECT value FROM fx_meta WHERE key = 'source_mtime'").fetchone()
+        if loaded and loaded[0] == mtime:
+            return False
+
+        reader = None
+        try:
+            with open(self.rates_file, newline='') as f:
+                reader = csv.DictReader(f)
+                rows = [(row['currency'].strip().upper(), row['date'].strip(),
+                         float(row['rate']))
+                        for row in reader]
+        except (OSError, UnicodeDecodeError, csv.Error, KeyError, ValueError,
+                TypeError, AttributeError) as e:
+            line = f" line {reader.line_num}" if reader else ""
+            self.load_error = f"Could not load {self.rates_file}{line}: {e}"
+            print(self.load_error)
+            return False
+
+        self.load_error = None
+        with self.conn:
+            self.conn.execute('DELETE FROM fx_rates')
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO fx_rates (currency, date, rate)
+                VALUES (?, ?, ?)
+            ''', rows)
+            self.conn.execute('''
+                INSERT OR REPLACE INTO fx_meta (key, value) VALUES ('source_mtime', ?)
+            ''', (mtime,))
+        self.rate_cache.clear()
+        return True
+
+    def currencies(self):
+        rows = self.conn.execute('SELECT DISTINCT currency FROM fx_rates ORDER BY currency')
+        return [self.base_currency] + [row[0] for row in rows if row[0] != self.base_currency]
+
+    def missing_rates(self, conn=None):
+        # Currencies with expenses that no rate covers; they are left out of totals
+        return (conn or self.conn).execute('''
+            SELECT currency, COUNT(*)
+            FROM expenses_converted
+            WHERE base_amount IS NULL
+            GROUP BY currency
+        ''').fetchall()
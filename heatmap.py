@@ -0,0 +1,59 @@
+import calendar
+from datetime import date
+import numpy as np
+
+# Calendar heatmap data: one grouped query per year gives a
+# (category x day-of-year) array, and month and year views are sliced
+# out of it with array indexing.
+
+
+class DailyRollup:
+    def __init__(self, year, categories, values):
+        self.year = year
+        self.categories = categories
+        self.values = values
+
+    def series(self, category=None):
+        # Daily totals for one category, or all categories added together
+        if category is None:
+            return self.values.sum(axis=0)
+        if category not in self.categories:
+            return np.zeros(self.values.shape[1])
+        return self.values[self.categories.index(category)]
+
+
+def load_rollup(conn, year):
+    rows = conn.execute('''
+        SELECT CAST(strftime('%j', date) AS INTEGER) - 1, category, SUM(base_amount)
+        FROM expenses_converted
+        WHERE date BETWEEN ? AND ? AND base_amount IS NOT NULL
+        GROUP BY date, category
+    ''', (f"{year}-01-01", f"{year}-12-31")).fetchall()
+
+    days = 366 if calendar.isleap(year) else 365
+    categories = sorted({category for _, category, _ in rows})
+    values = np.zeros((len(categories), days))
+    if rows:
+        day_index, category_names, amounts = zip(*rows)
+        lookup = {category: i for i, category in enumerate(categories)}
+        rows_index = np.fromiter((lookup[c] for c in category_names), dtype=int,
+                                 count=len(category_names))
+        np.add.at(values, (rows_index, np.asarray(day_index)), np.asarray(amounts))
+    return DailyRollup(year, categories, values)
+
+
+def month_grid(daily, year, month):
+    # 6 x 7 grid (weeks x weekdays, Monday first); cells outside the month are NaN
+    first_weekday, days = calendar.monthrange(year, month)
+    offset = date(year, month, 1).timetuple().tm_yday - 1
+    grid = np.full(42, np.nan)
+    grid[first_weekday:first_weekday + days] = daily[offset:offset + days]
+    return grid.reshape(6, 7)
+
+
+def year_grid(daily, year):
+    # 7 x 54 grid (weekdays x weeks), enough columns for any year
+    first_weekday = date(year, 1, 1).weekday()
+    grid = np.full(7 * 54, np.nan)
+    grid[first_weekday:first_weekday + len(daily)] = daily
+    return grid.reshape(54, 7).T
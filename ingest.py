@@ -0,0 +1,276 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+from anomaly import AnomalyDetector
+from fx import FxRates
+
+# Headless ingest daemon: polls a drop directory for CSV and JSONL files,
+# reads only complete lines past each file's checkpoint and inserts them in
+# batched transactions. The checkpoint moves in the same transaction as the
+# rows, so a restart resumes exactly where the last commit stopped.
+
+PATTERNS = ('.csv', '.jsonl')
+READ_SIZE = 64 * 1024
+
+# Leading bytes hashed to tell a replaced file from one that only grew
+FINGERPRINT_SIZE = 1024
+
+# A CSV header must name these columns before any of its rows are read
+REQUIRED_COLUMNS = ('date', 'category', 'amount')
+
+
+def parse_csv_line(line, header):
+    return dict(zip(header, next(csv.reader([line]))))
+
+
+def parse_jsonl_line(line, header):
+    return json.loads(line)
+
+
+def fingerprint(path, length):
+    # Hash of the first bytes already ingested (at most FINGERPRINT_SIZE).
+    # Content only: exporters that rewrite the file and rename it over the
+    # old one give it a new inode but keep the ingested prefix.
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read(min(length, FINGERPRINT_SIZE))).hexdigest()
+
+
+def parse_header(line):
+    return [name.strip().lower() for name in next(csv.reader([line]))]
+
+
+def to_expense(row):
+    # Normalize one parsed row; raises ValueError or KeyError on bad input
+    date = datetime.strptime(row['date'].strip(), '%Y-%m-%d').strftime('%Y-%m-%d')
+    currency = (row.get('currency') or '').strip().upper() or None
+    return (date, row['category'].strip(), float(row['amount']),
+            (row.get('description') or '').strip(), currency)
+
+
+class IngestDaemon:
+    def __init__(self, conn, drop_dir, batch_size=1000, base_currency='USD'):
+        self.conn = conn
+        self.drop_dir = drop_dir
+        self.batch_size = batch_size
+        self.fx = FxRates(conn, base_currency)
+        self.anomaly_detector = AnomalyDetector(conn)
+        self.metrics = {'rows': 0, 'bytes': 0, 'errors': 0, 'rows_per_sec': 0.0, 'lag': 0.0,
+                        'rejected': 0}
+        # Files refused for their header, by path, with the fingerprint of
+        # their start so they are retried only once they change
+        self.rejected = {}
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+                path TEXT PRIMARY KEY,
+                offset INTEGER,
+                header TEXT,
+                fingerprint TEXT
+            )
+        ''')
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(ingest_checkpoints)')]
+        if 'fingerprint' not in columns:
+            self.conn.execute('ALTER TABLE ingest_checkpoints ADD COLUMN fingerprint TEXT')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_metrics (
+                key TEXT PRIMARY KEY,
+                value REAL
+            )
+        ''')
+        self.conn.commit()
+
+    def checkpoint(self, path):
+        row = self.conn.execute('''
+            SELECT offset, header, fingerprint FROM ingest_checkpoints WHERE path = ?
+        ''', (path,)).fetchone()
+        if row is None:
+            return 0, None, None
+        return row[0], json.loads(row[1]) if row[1] else None, row[2]
+
+    def pending_files(self):
+        # Files that grew past their checkpoint since the last scan
+        for name in sorted(os.listdir(self.drop_dir)):
+            if not name.endswith(PATTERNS):
+                continue
+            path = os.path.abspath(os.path.join(self.drop_dir, name))
+            if not os.path.isfile(path):
+                continue
+            size = os.path.getsize(path)
+            if path in self.rejected:
+                if self.rejected[path] == fingerprint(path, size):
+                    continue
+                del self.rejected[path]
+                self.metrics['rejected'] = len(self.rejected)
+            offset, header, stored = self.checkpoint(path)
+            if stored:
+                # Checkpoints from before content-only fingerprints were "inode:hash"
+                stored = stored.rpartition(':')[2]
+            if size < offset or (stored and stored != fingerprint(path, offset)):
+                # Replaced or truncated: treat it as a new file
+                offset, header = 0, None
+            if size > offset:
+                yield path, offset, header
+
+    def iter_lines(self, path, offset):
+        # Yield (raw line, end_offset) for complete lines only; a trailing
+        # line without a newline is still being written and is left for later.
+        # Lines are decoded by the caller so one bad byte costs one row.
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            buffer = b''
+            while True:
+                chunk = f.read(READ_SIZE)
+                if not chunk:
+                    return
+                buffer += chunk
+                start = 0
+                while True:
+                    end = buffer.find(b'\n', start)
+                    if end == -1:
+                        break
+                    offset += end + 1 - start
+                    yield buffer[start:end], offset
+                    start = end + 1
+                buffer = buffer[start:]
+
+    def ingest_file(self, path, offset, header):
+        parse = parse_csv_line if path.endswith('.csv') else parse_jsonl_line
+        batch = []
+        end_offset = offset
+        for raw, end_offset in self.iter_lines(path, offset):
+            try:
+                # Excel's "CSV UTF-8" starts the file with a byte order mark
+                line = raw.decode('utf-8').lstrip('\ufeff').rstrip('\r')
+            except UnicodeDecodeError:
+                line = None
+            if parse is parse_csv_line and header is None:
+                if line is not None and not line.strip():
+                    continue
+                header = parse_header(line) if line is not None else []
+                missing = [name for name in REQUIRED_COLUMNS if name not in header]
+                if missing:
+                    # Nothing is checkpointed, so a corrected file is read in full
+                    self.reject(path, f"header has no {', '.join(missing)} column")
+                    return 0
+                continue
+            if line is None:
+                self.metrics['errors'] += 1
+                continue
+            if not line.strip():
+                continue
+            try:
+                batch.append(to_expense(parse(line, header)))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                self.metrics['errors'] += 1
+            if len(batch) >= self.batch_size:
+                self.commit_batch(path, batch, end_offset, header)
+                batch = []
+        if end_offset > offset:
+            self.commit_batch(path, batch, end_offset, header)
+        return end_offset - offset
+
+    def reject(self, path, reason):
+        self.rejected[path] = fingerprint(path, os.path.getsize(path))
+        self.metrics['rejected'] = len(self.rejected)
+        print(f"Skipped {path}: {reason}", flush=True)
+
+    def commit_batch(self, path, batch, end_offset, header):
+        with self.conn:
+            rows = []
+            for date, category, amount, description, currency in batch:
+                # Rows without a currency are in the reporting currency
+                currency = currency or self.fx.base_currency
+                cursor = self.conn.execute('''
+                    INSERT INTO expenses (date, category, amount, description, currency)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (date, category, amount, description, currency))
+                base_amount = self.fx.convert(amount, currency, date)
+                if base_amount is not None:
+                    rows.append((cursor.lastrowid, date, category, base_amount, description))
+            self.anomaly_detector.observe_many(rows)
+            self.conn.execute('''
+                INSERT OR REPLACE INTO ingest_checkpoints (path, offset, header, fingerprint)
+                VALUES (?, ?, ?, ?)
+            ''', (path, end_offset, json.dumps(header) if header else None,
+                  fingerprint(path, end_offset)))
+        self.metrics['rows'] += len(batch)
+
+    def poll(self):
+        # One pass over the drop directory; returns rows ingested
+        started = time.time()
+        rows_before = self.metrics['rows']
+        lag = 0.0
+        pending = list(self.pending_files())
+        for path, offset, header in pending:
+            # Lag: how long the newest data waited before this pass picked it up
+            lag = max(lag, started - os.path.getmtime(path))
+            self.metrics['bytes'] += self.ingest_file(path, offset, header)
+
+        rows = self.metrics['rows'] - rows_before
+        if rows:
+            elapsed = max(time.time() - started, 1e-6)
+            self.metrics['rows_per_sec'] = rows / elapsed
+            self.metrics['lag'] = lag
+        if pending:
+            # Idle scans write nothing, so the app is only woken for new data
+            self.save_metrics()
+        return rows
+
+    def save_metrics(self):
+        with self.conn:
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO ingest_metrics (key, value) VALUES (?, ?)
+            ''', list(self.metrics.items()) + [('updated', time.time())])
+
+    def run(self, interval=1.0):
+        while True:
+            rows = self.poll()
+            if rows:
+                print(f"Ingested {rows} rows ({self.metrics['rows_per_sec']:.0f} rows/s, "
+                      f"lag {self.metrics['lag']:.1f}s, {self.metrics['errors']} errors)",
+                      flush=True)
+            time.sleep(interval)
+
+
+def read_metrics(conn):
+    # Latest ingest metrics for display, empty if the daemon never ran
+    try:
+        return dict(conn.execute('SELECT key, value FROM ingest_metrics').fetchall())
+    except sqlite3.OperationalError:
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest expenses from a drop directory")
+    parser.add_argument('drop_dir', help="directory to watch for .csv and .jsonl files")
+    parser.add_argument('--db', default='expenses.db', help="ledger database")
+    parser.add_argument('--interval', type=float, default=1.0, help="seconds between scans")
+    parser.add_argument('--batch', type=int, default=1000, help="rows per transaction")
+    parser.add_argument('--once', action='store_true', help="scan once and exit")
+    args = parser.parse_args()
+
+    settings = {}
+    if os.path.exists('expense_settings.json'):
+        with open('expense_settings.json', 'r') as f:
+            settings = json.load(f)
+
+    conn = sqlite3.connect(args.db)
+    conn.execute('PRAGMA journal_mode = WAL')
+    daemon = IngestDaemon(conn, args.drop_dir, args.batch, settings.get('currency', 'USD'))
+    try:
+        if args.once:
+            print(f"Ingested {daemon.poll()} rows")
+        else:
+            daemon.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from queue import Queue, Empty
+
+MIB = 1024 * 1024
+
+# Bounds for the per-connection mmap window and page cache
+MIN_MMAP = 16 * MIB
+MAX_MMAP = 1024 * MIB
+MAX_CACHE = 64 * MIB
+
+
+def reader_pragmas(db_path):
+    # Map the whole ledger with room to grow, and cache up to its size
+    size = os.path.getsize(db_path) if os.path.exists(db_path) else 0
+    mmap_size = min(MAX_MMAP, max(MIN_MMAP, size * 2))
+    cache_kib = max(2048, min(MAX_CACHE, size) // 1024)
+    return mmap_size, cache_kib
+
+
+def open_reader(db_path):
+    # Read-only connection: opened with mode=ro and query_only on top, so
+    # analytics can never take a write lock
+    uri = 'file:' + os.path.abspath(db_path) + '?mode=ro'
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    mmap_size, cache_kib = reader_pragmas(db_path)
+    conn.execute(f'PRAGMA mmap_size = {mmap_size}')
+    conn.execute(f'PRAGMA cache_size = -{cache_kib}')
+    conn.execute('PRAGMA query_only = ON')
+    return conn
+
+
+class ReaderPool:
+    # Small pool of read-only connections kept separate from the single
+    # writer, so summaries, filters and exports do not share its cursor
+    def __init__(self, db_path, size=2):
+        self.db_path = db_path
+        self.idle = Queue()
+        self.all = []
+        for _ in range(size):
+            conn = open_reader(db_path)
+            self.all.append(conn)
+            self.idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except Empty:
+            # Pool exhausted, e.g. a nested read; use a short-lived extra reader
+            conn = open_reader(self.db_path)
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+    def close(self):
+        for conn in self.all:
+            conn.close()
+        self.all = []
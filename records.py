@@ -0,0 +1,69 @@
+# Compact expense rows and streaming helpers for the expense list
+
+# Rows are pulled from the cursor in batches of this size
+FETCH_SIZE = 256
+
+# Number of records formatted into one text insert
+PAGE_SIZE = 50
+
+SEPARATOR = '-' * 40 + '\n'
+
+# Templates are built once; the currency line is filled in only for
+# expenses that are not in the reporting currency
+RECORD_TEMPLATE = (
+    "Date: {0}\n"
+    "Category: {1}\n"
+    "Amount: ${2:.2f}\n"
+    "Description: {3}\n"
+    "{4}" + SEPARATOR
+).format
+CURRENCY_TEMPLATE = "Currency: {0} (= ${1:.2f})\n".format
+NO_RATE_TEMPLATE = "Currency: {0} (no rate)\n".format
+
+
+class ExpenseRecord:
+    __slots__ = ('date', 'category', 'amount', 'description', 'currency', 'base_amount')
+
+    def __init__(self, date, category, amount, description, currency=None, base_amount=None):
+        self.date = date
+        self.category = category
+        self.amount = amount
+        self.description = description
+        self.currency = currency
+        self.base_amount = base_amount
+
+    def format(self, base_currency):
+        if self.currency is None or self.currency == base_currency:
+            currency_line = ""
+        elif self.base_amount is None:
+            currency_line = NO_RATE_TEMPLATE(self.currency)
+        else:
+            currency_line = CURRENCY_TEMPLATE(self.currency, self.base_amount)
+        return RECORD_TEMPLATE(self.date, self.category, self.amount,
+                               self.description, currency_line)
+
+
+def record_factory(cursor, row):
+    # sqlite3 row_factory building records straight from the result row
+    return ExpenseRecord(*row)
+
+
+def iter_records(cursor, size=FETCH_SIZE):
+    # Stream rows from an executed cursor without materializing the result
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+def iter_pages(records, base_currency, page_size=PAGE_SIZE):
+    # Join formatted records into one string per page
+    page = []
+    for record in records:
+        page.append(record.format(base_currency))
+        if len(page) == page_size:
+            yield ''.join(page)
+            page = []
+    if page:
+        yield ''.join(page)
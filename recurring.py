@@ -0,0 +1,189 @@
+import calendar
+from datetime import date, datetime, timedelta
+
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def add_months(start, months, anchor_day):
+    # Keeps the rule's original day of month, clamped to shorter months
+    month_index = start.month - 1 + months
+    year = start.year + month_index // 12
+    month = month_index % 12 + 1
+    return date(year, month, min(anchor_day, calendar.monthrange(year, month)[1]))
+
+
+def occurrences(start_date, frequency, interval, end_date, range_start, range_end):
+    # Lazily yield the rule's dates that fall inside [range_start, range_end]
+    start = parse_date(start_date)
+    last = range_end
+    if end_date:
+        last = min(last, parse_date(end_date))
+    if last < start or last < range_start:
+        return
+
+    if frequency == 'monthly':
+        # Jump straight to the first month that can reach the range
+        skip = max(0, (range_start.year - start.year) * 12 +
+                   range_start.month - start.month - 1)
+        step = skip // interval
+        current = add_months(start, step * interval, start.day)
+        while current <= last:
+            if current >= range_start:
+                yield current
+            step += 1
+            current = add_months(start, step * interval, start.day)
+    else:
+        days = interval * (7 if frequency == 'weekly' else 1)
+        skip = max(0, (range_start - start).days)
+        current = start + timedelta(days=-(-skip // days) * days)
+        while current <= last:
+            yield current
+            current += timedelta(days=days)
+
+
+class RecurringExpenses:
+    # Recurring rules are stored once and only turned into expense rows for
+    # the dates a caller actually needs. Each rule remembers how far it has
+    # been materialized, so the ledger grows one period at a time.
+    def __init__(self, conn, anomaly_detector=None, currency=None):
+        # `currency` is the reporting currency, used for rules that do not
+        # name one
+        self.conn = conn
+        self.anomaly_detector = anomaly_detector
+        self.currency = currency
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS recurring_rules (
+                id INTEGER PRIMARY KEY,
+                category TEXT,
+                amount REAL,
+                description TEXT,
+                frequency TEXT,
+                interval INTEGER DEFAULT 1,
+                start_date TEXT,
+                end_date TEXT,
+                materialized_through TEXT,
+                currency TEXT
+            )
+        ''')
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(recurring_rules)')]
+        if 'currency' not in columns:
+            # Rules created before currencies were tracked are in the reporting currency
+            self.conn.execute('ALTER TABLE recurring_rules ADD COLUMN currency TEXT')
+            self.conn.execute('UPDATE recurring_rules SET currency = ?', (currency,))
+        self.conn.commit()
+
+    def add_rule(self, category, amount, description, start_date,
+                 frequency='monthly', interval=1, end_date=None, currency=None):
+        currency = currency or self.currency
+        # Dates are compared as strings, so store them zero-padded
+        start_date = parse_date(start_date).strftime('%Y-%m-%d')
+        if end_date:
+            end_date = parse_date(end_date).strftime('%Y-%m-%d')
+        if frequency not in FREQUENCIES:
+            raise ValueError(f"Unknown frequency: {frequency}")
+        if interval < 1:
+            raise ValueError("Interval must be at least 1")
+        if end_date and end_date < start_date:
+            raise ValueError("End date is before start date")
+        cursor = self.conn.execute('''
+            INSERT INTO recurring_rules
+                (category, amount, description, frequency, interval, start_date, end_date,
+                 currency)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (category, amount, description, frequency, interval, start_date, end_date,
+              currency))
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def end_rule(self, rule_id, end_date=None):
+        # Stop a rule after `end_date` (default today), keeping its history
+        end_date = (parse_date(end_date) if end_date else date.today()).strftime('%Y-%m-%d')
+        self.conn.execute('''
+            UPDATE recurring_rules SET end_date = ?
+            WHERE id = ? AND (end_date IS NULL OR end_date > ?)
+        ''', (end_date, rule_id, end_date))
+        self.conn.commit()
+
+    def delete_rule(self, rule_id):
+        # Rows already materialized stay in the ledger
+        self.conn.execute('DELETE FROM recurring_rules WHERE id = ?', (rule_id,))
+        self.conn.commit()
+
+    def rules(self, conn=None):
+        # `conn` lets callers read through a reader connection instead
+        return (conn or self.conn).execute('''
+            SELECT id, category, amount, description, frequency, interval,
+                   start_date, end_date, materialized_through,
+                   COALESCE(currency, ?)
+            FROM recurring_rules
+            ORDER BY id
+        ''', (self.currency,)).fetchall()
+
+    def expand(self, range_start, range_end, conn=None):
+        # Occurrences in a date range as (date, category, amount, description,
+        # currency), without touching the ledger; used for forecasts
+        for (_, category, amount, description, frequency, interval,
+             start_date, end_date, _, currency) in self.rules(conn):
+            for day in occurrences(start_date, frequency, interval, end_date,
+                                   range_start, range_end):
+                yield day.strftime('%Y-%m-%d'), category, amount, description, currency
+
+    def projected_totals(self, range_start, range_end, convert=None, conn=None):
+        # `convert(amount, currency, date)` maps amounts into the reporting
+        # currency; occurrences it cannot convert are left out
+        totals = {}
+        for day, category, amount, _, currency in self.expand(range_start, range_end, conn):
+            if convert:
+                amount = convert(amount, currency, day)
+                if amount is None:
+                    continue
+            totals[category] = totals.get(category, 0) + amount
+        return totals
+
+    def materialize_through(self, until=None):
+        # Insert every pending occurrence up to `until` (default today),
+        # committing one transaction per calendar month
+        until = until or date.today()
+        pending = {}
+        for (rule_id, category, amount, description, frequency, interval,
+             start_date, end_date, materialized_through, currency) in self.rules():
+            range_start = parse_date(start_date)
+            if materialized_through:
+                range_start = parse_date(materialized_through) + timedelta(days=1)
+            for day in occurrences(start_date, frequency, interval, end_date,
+                                   range_start, until):
+                pending.setdefault(day.strftime('%Y-%m'), []).append(
+                    (rule_id, day.strftime('%Y-%m-%d'), category, amount, description,
+                     currency))
+
+        inserted = 0
+        for period in sorted(pending):
+            with self.conn:
+                rows = []
+                for rule_id, day, category, amount, description, currency in pending[period]:
+                    cursor = self.conn.execute('''
+                        INSERT INTO expenses (date, category, amount, description, currency)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (day, category, amount, description, currency))
+                    if currency == self.currency:
+                        rows.append((cursor.lastrowid, day, category, amount, description))
+                    self.conn.execute('''
+                        UPDATE recurring_rules SET materialized_through = ?
+                        WHERE id = ?
+                    ''', (day, rule_id))
+                if self.anomaly_detector:
+                    self.anomaly_detector.observe_many(rows)
+            inserted += len(rows)
+
+        # Rules with nothing due still advance, so the next call starts at `until`
+        with self.conn:
+            self.conn.execute('''
+                UPDATE recurring_rules SET materialized_through = ?
+                WHERE start_date <= ?
+                  AND (materialized_through IS NULL OR materialized_through < ?)
+            ''', (until.strftime('%Y-%m-%d'),) * 3)
+        return inserted
@@ -0,0 +1,286 @@
+import sqlite3
+import json
+import os
+import argparse
+import calendar
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from anomaly import AnomalyDetector
+from recurring import RecurringExpenses
+from budgets import BudgetHistory
+from fx import FxLookup, FxRates
+from readers import open_reader
+
+# Headless monthly reports: the same numbers as the Summary tab, printed to
+# stdout or rendered offscreen with Agg into PDF/PNG files, so they can run
+# from cron or a terminal without a display.
+
+
+def load_settings(settings_file='expense_settings.json'):
+    if os.path.exists(settings_file):
+        with open(settings_file, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def prepare_ledger(conn):
+    # Bring the ledger up to date the same way the app does on startup
+    settings = load_settings()
+    currency = settings.get('currency', 'USD')
+    FxRates(conn, currency)
+    RecurringExpenses(conn, AnomalyDetector(conn), currency).materialize_through()
+    budget_history = BudgetHistory(conn)
+    if budget_history.is_empty():
+        budget_history.seed(settings.get('budgets', {}))
+    return budget_history
+
+
+def category_totals(conn, month):
+    return conn.execute('''
+        SELECT category, SUM(base_amount)
+        FROM expenses_converted
+        WHERE date LIKE ? AND base_amount IS NOT NULL
+        GROUP BY category
+        ORDER BY category
+    ''', (month + '%',)).fetchall()
+
+
+def daily_totals(conn, month):
+    return conn.execute('''
+        SELECT date, SUM(base_amount)
+        FROM expenses_converted
+        WHERE date LIKE ? AND base_amount IS NOT NULL
+        GROUP BY date
+        ORDER BY date
+    ''', (month + '%',)).fetchall()
+
+
+def build_report(conn, month):
+    budgets = BudgetHistory(conn).budgets_for(month)
+    totals = category_totals(conn, month)
+    total = sum(amount for _, amount in totals)
+
+    lines = [f"Expense Report for {month}", "", f"Total Expenses: ${total:.2f}", ""]
+    for category, amount in totals:
+        budget = budgets.get(category, 0)
+        lines.append(f"{category}:")
+        lines.append(f"  Spent: ${amount:.2f}")
+        lines.append(f"  Budget: ${budget:.2f}")
+        lines.append(f"  {'Over budget by' if amount > budget else 'Under budget by'}: "
+                     f"${abs(amount - budget):.2f}")
+        lines.append("")
+
+    # Recurring spend not yet materialized for the rest of the month
+    year, mon = map(int, month.split('-'))
+    month_end = datetime(year, mon, calendar.monthrange(year, mon)[1]).date()
+    tomorrow = datetime.now().date() + timedelta(days=1)
+    if month_end >= tomorrow:
+        first_day = max(tomorrow, month_end.replace(day=1))
+        # Converted with read-only lookups, so this also runs on reader connections
+        fx = FxLookup(conn)
+        upcoming = RecurringExpenses(conn, None, fx.base_currency).projected_totals(
+            first_day, month_end, fx.convert)
+        if upcoming:
+            lines.append("Upcoming Recurring:")
+            for category, amount in sorted(upcoming.items()):
+                lines.append(f"  {category}: ${amount:.2f}")
+            lines.append("")
+
+    # Unusual expenses were flagged when they were added; only read them back
+    anomalies = conn.execute('''
+        SELECT date, category, amount, description, score, typical
+        FROM expense_anomalies
+        WHERE date LIKE ?
+        ORDER BY date DESC, expense_id DESC
+    ''', (month + '%',)).fetchall()
+    if anomalies:
+        lines.append("Unusual Expenses:")
+        for date, category, amount, description, score, typical in anomalies:
+            lines.append(f"  {date} {category}: ${amount:.2f} ({description}) - "
+                         f"usual ${typical:.2f}, {score:.1f} std devs above")
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def build_budget_report(conn):
+    lines = ["Budget vs Actual", "",
+             f"{'Month':<8} {'Category':<14} {'Spent':>10} {'Budget':>10} {'Diff':>10}"]
+    for month, category, spent, budget in BudgetHistory(conn).budget_vs_actual():
+        if budget is None:
+            lines.append(f"{month:<8} {category:<14} {spent:>10.2f} {'-':>10} {'-':>10}")
+        else:
+            lines.append(f"{month:<8} {category:<14} {spent:>10.2f} {budget:>10.2f} "
+                         f"{budget - spent:>10.2f}")
+    return "\n".join(lines)
+
+
+def report_months(conn, year=None):
+    query = 'SELECT DISTINCT substr(date, 1, 7) FROM expenses'
+    params = []
+    if year:
+        query += ' WHERE date LIKE ?'
+        params.append(f"{year}-%")
+    query += ' ORDER BY 1'
+    return [row[0] for row in conn.execute(query, params)]
+
+
+# Per-process render state: one connection and one figure per chart type,
+# created by the pool initializer and reused for every period the worker draws
+_worker = {}
+
+
+def _init_worker(db_path):
+    _worker['conn'] = open_reader(db_path)
+
+    fig_summary = Figure(figsize=(8.27, 11.69))
+    FigureCanvasAgg(fig_summary)
+    summary_text = fig_summary.text(0.08, 0.95, "", family="monospace",
+                                    fontsize=9, va="top")
+
+    fig_pie = Figure(figsize=(8.27, 5.85))
+    FigureCanvasAgg(fig_pie)
+    ax_pie = fig_pie.add_subplot()
+
+    fig_trends = Figure(figsize=(8.27, 5.85))
+    FigureCanvasAgg(fig_trends)
+    ax_trends = fig_trends.add_subplot()
+
+    _worker['summary'] = (fig_summary, summary_text)
+    _worker['pie'] = (fig_pie, ax_pie)
+    _worker['trends'] = (fig_trends, ax_trends)
+
+
+def _draw_period(month):
+    conn = _worker['conn']
+
+    fig_summary, summary_text = _worker['summary']
+    summary_text.set_text(build_report(conn, month))
+
+    fig_pie, ax_pie = _worker['pie']
+    ax_pie.clear()
+    totals = category_totals(conn, month)
+    if totals:
+        categories, amounts = zip(*totals)
+        ax_pie.pie(amounts, labels=categories, autopct='%1.1f%%')
+    ax_pie.set_title(f"Expenses by Category ({month})")
+
+    fig_trends, ax_trends = _worker['trends']
+    ax_trends.clear()
+    results = daily_totals(conn, month)
+    if results:
+        dates, amounts = zip(*results)
+        days = [int(date[8:10]) for date in dates]
+        ax_trends.bar(days, amounts)
+        year, mon = map(int, month.split('-'))
+        ax_trends.set_xlim(0.5, calendar.monthrange(year, mon)[1] + 0.5)
+    ax_trends.set_title(f"Daily Expenses ({month})")
+    ax_trends.set_xlabel("Day")
+    ax_trends.set_ylabel("Amount ($)")
+    fig_trends.tight_layout()
+
+    return [('summary', fig_summary), ('pie', fig_pie), ('trends', fig_trends)]
+
+
+def _render_period(month, out_prefix, fmt):
+    pages = _draw_period(month)
+    if fmt == 'pdf':
+        path = f"{out_prefix}_{month}.pdf"
+        with PdfPages(path) as pdf:
+            for _, fig in pages:
+                pdf.savefig(fig)
+        return [path]
+
+    paths = []
+    for name, fig in pages:
+        path = f"{out_prefix}_{month}_{name}.png"
+        fig.savefig(path, dpi=100)
+        paths.append(path)
+    return paths
+
+
+def ledger_names(db_paths):
+    # Shortest trailing part of each ledger's path (without extension) that
+    # tells it apart from the others: a/expenses.db and b/expenses.db become
+    # a/expenses and b/expenses, a single ledger is just its file name
+    parts = [os.path.splitext(os.path.abspath(path))[0].strip(os.sep).split(os.sep)
+             for path in db_paths]
+    names = []
+    for path, own in zip(db_paths, parts):
+        for length in range(1, len(own) + 1):
+            suffix = own[-length:]
+            if sum(other[-length:] == suffix for other in parts) == 1:
+                break
+        else:
+            # Paths that differ only in their extension keep it
+            suffix = [os.path.basename(path)]
+        names.append(os.path.join(*suffix))
+    return names
+
+
+def render_reports(db_path, out_dir, fmt='pdf', year=None, workers=None, name=None):
+    # `name` is the ledger's output prefix under out_dir, see ledger_names()
+    conn = sqlite3.connect(db_path)
+    try:
+        # Bring the ledger up to date before workers read it
+        prepare_ledger(conn)
+        months = report_months(conn, year)
+    finally:
+        conn.close()
+    if not months:
+        return []
+
+    name = name or os.path.splitext(os.path.basename(db_path))[0]
+    out_prefix = os.path.join(out_dir, name)
+    os.makedirs(os.path.dirname(out_prefix), exist_ok=True)
+
+    written = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(db_path,)) as pool:
+        futures = [pool.submit(_render_period, month, out_prefix, fmt) for month in months]
+        for future in futures:
+            written.extend(future.result())
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless expense reports")
+    parser.add_argument('month', nargs='?', default=datetime.now().strftime('%Y-%m'),
+                        help="month to print as text (YYYY-MM)")
+    parser.add_argument('--render', choices=['pdf', 'png'],
+                        help="render every month to files instead of printing one")
+    parser.add_argument('--budgets', action='store_true',
+                        help="print budget vs actual for every month instead")
+    parser.add_argument('--year', help="only render months of this year")
+    parser.add_argument('--db', action='append',
+                        help="ledger database, may be repeated (default expenses.db)")
+    parser.add_argument('--out', default='reports', help="output directory")
+    parser.add_argument('--workers', type=int, help="number of render processes")
+    args = parser.parse_args()
+    # The same file named twice is one ledger
+    ledgers = list(dict.fromkeys(os.path.abspath(path) for path in args.db or ['expenses.db']))
+
+    if args.render:
+        for db_path, name in zip(ledgers, ledger_names(ledgers)):
+            for path in render_reports(db_path, args.out, args.render,
+                                       args.year, args.workers, name):
+                print(path)
+        return
+
+    for db_path in ledgers:
+        conn = sqlite3.connect(db_path)
+        try:
+            prepare_ledger(conn)
+            if args.budgets:
+                print(build_budget_report(conn))
+            else:
+                print(build_report(conn, args.month))
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()